@@ -0,0 +1,45 @@
+# app/ai/batch_state.py
+import json
+
+import redis.asyncio as redis
+
+from app.config import settings
+
+KEY = "openai:keyword_batches"  # hash: id батча -> JSON-список id постов
+
+# Ошибки Redis здесь не глотаются: потерянная запись о батче означает
+# оплаченный, но не обработанный батч и повторную отправку тех же постов.
+
+
+async def get_pending_batches() -> dict[str, list[str]]:
+    """
+    Возвращает незавершённые батчи тегов из Redis: id батча -> id постов.
+    Если Redis не настроен — пустой словарь.
+    """
+    if not settings.redis_url:
+        return {}
+
+    client = redis.from_url(settings.redis_url, decode_responses=True)
+    try:
+        batches = await client.hgetall(KEY)
+    finally:
+        await client.aclose()
+    return {batch_id: json.loads(post_ids) for batch_id, post_ids in batches.items()}
+
+
+async def add_pending_batch(batch_id: str, post_ids: list[str]):
+    """Запоминает отправленный батч и посты, которые в него вошли."""
+    client = redis.from_url(settings.redis_url)
+    try:
+        await client.hset(KEY, batch_id, json.dumps(post_ids))
+    finally:
+        await client.aclose()
+
+
+async def remove_pending_batch(batch_id: str):
+    """Удаляет обработанный батч."""
+    client = redis.from_url(settings.redis_url)
+    try:
+        await client.hdel(KEY, batch_id)
+    finally:
+        await client.aclose()
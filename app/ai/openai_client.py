@@ -1,14 +1,42 @@
 # app/ai/openai_client.py
 import aiohttp
 import asyncio
+import json
+import re
+import time
+from contextlib import asynccontextmanager
 from typing import List
 from app.config import settings
 from app.logger import logger
+from app.utils.loop_bound import LoopBound
+from app.utils.rate_limit import SlidingWindowLimiter
+
+
+# Доля оставшейся квоты, ниже которой запросы ставятся на паузу до сброса окна
+RATE_LIMIT_THRESHOLD = 0.1
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
 
 
 class RateLimitError(Exception):
     """Исключение для обработки rate limit OpenAI (HTTP 429)"""
-    pass
+
+    def __init__(self, message: str = "", retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after  # секунды из заголовка Retry-After
+
+
+class ServerError(Exception):
+    """Исключение для ошибок на стороне OpenAI (HTTP 5xx: перегрузка, сбой)"""
+
+    def __init__(self, message: str = "", status: int = 500):
+        super().__init__(message)
+        self.status = status
+
+
+# Временные ошибки, после которых запрос имеет смысл повторить (4xx, кроме 429, — нет)
+RETRYABLE_ERRORS = (RateLimitError, ServerError, asyncio.TimeoutError, aiohttp.ClientConnectionError)
 
 
 class OpenAIClient:
@@ -21,6 +49,8 @@ class OpenAIClient:
     def __init__(self, api_key: str = None, proxy: str = None):
         self.api_key = api_key or settings.openai_api_key
         self.proxy = proxy or settings.openai_proxy
+        self.limiter = SlidingWindowLimiter(rpm=settings.openai_rpm, tpm=settings.openai_tpm)
+        self._session = LoopBound(aiohttp.ClientSession)
 
         if not self.api_key:
             logger.error("❌ OPENAI_API_KEY не задан!")
@@ -47,35 +77,164 @@ class OpenAIClient:
             logger.error(f"❌ Ошибка разбора прокси {self.proxy}: {e}")
             return None
 
-    async def _request(self, endpoint: str, payload: dict, timeout: int = 30) -> dict:
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Общая HTTP-сессия: пул соединений (TCP + TLS) переиспользуется между запросами.
+        Сессия привязана к event loop, при смене loop создаём заново.
+        """
+        session = self._session.get()
+        if session.closed:
+            self._session.reset()
+            session = self._session.get()
+        return session
+
+    async def start(self):
+        """Открывает HTTP-сессию заранее (при старте воркера/приложения)."""
+        self._get_session()
+
+    async def close(self):
+        """Закрывает HTTP-сессию."""
+        session = self._session.current()
+        if session is not None and not session.closed:
+            await session.close()
+        self._session.reset()
+
+    @staticmethod
+    def _parse_retry_after(headers) -> float | None:
+        """
+        Значение заголовка Retry-After в секундах (если задано числом).
+        """
+        value = headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _parse_duration(value: str | None) -> float | None:
         """
-        Универсальный метод запроса к OpenAI API
+        Длительность из заголовков x-ratelimit-reset-* ("20ms", "1s", "6m0s") в секундах.
+        """
+        if not value:
+            return None
+        parts = _DURATION_PART.findall(value)
+        if not parts:
+            return None
+        return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+    @staticmethod
+    def _estimate_tokens(payload: dict) -> int:
+        """
+        Грубая оценка токенов запроса: ~4 символа на токен плюс лимит ответа.
+        """
+        chars = sum(len(message.get("content", "")) for message in payload.get("messages", []))
+        return chars // 4 + payload.get("max_tokens", 0)
+
+    def _apply_rate_headers(self, headers):
+        """
+        Если квота запросов или токенов почти исчерпана — пауза до сброса окна.
+        """
+        retry_after = self._parse_retry_after(headers)
+
+        for kind in ("requests", "tokens"):
+            try:
+                remaining = int(headers[f"x-ratelimit-remaining-{kind}"])
+                limit = int(headers[f"x-ratelimit-limit-{kind}"])
+            except (KeyError, ValueError):
+                continue
+
+            if remaining < limit * RATE_LIMIT_THRESHOLD:
+                delay = retry_after or self._parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if delay:
+                    logger.info(f"⏳ OpenAI квота {kind}: осталось {remaining}/{limit}")
+                    self.limiter.pause_until(time.monotonic() + delay)
+
+    @asynccontextmanager
+    async def _open(self, method: str, endpoint: str, timeout: int = 30, **kwargs):
+        """
+        Запрос к OpenAI API, отдаёт успешный ответ (ошибки превращаются в исключения)
         """
         if not self.api_key:
             raise RuntimeError("OPENAI_API_KEY не задан")
 
         proxy_url = self._format_proxy()
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.BASE_URL}{endpoint}",
-                json=payload,
-                headers={"Authorization": f"Bearer {self.api_key}"},
-                proxy=proxy_url,
-                timeout=aiohttp.ClientTimeout(total=timeout),
-            ) as response:
+        async with self._get_session().request(
+            method,
+            f"{self.BASE_URL}{endpoint}",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            proxy=proxy_url,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            **kwargs,
+        ) as response:
+
+            if response.status == 429:
+                text = await response.text()
+                logger.warning(f"⏳ OpenAI rate limit: {text}")
+                retry_after = self._parse_retry_after(response.headers)
+                if retry_after:
+                    self.limiter.pause_until(time.monotonic() + retry_after)
+                raise RateLimitError(text, retry_after=retry_after)
+
+            self._apply_rate_headers(response.headers)
 
+            if response.status >= 500:
                 text = await response.text()
+                logger.warning(f"⚠️ OpenAI API {response.status}: {text}")
+                raise ServerError(f"OpenAI error {response.status}: {text}", status=response.status)
 
-                if response.status == 429:
-                    logger.warning(f"⏳ OpenAI rate limit: {text}")
-                    raise RateLimitError(text)
+            if response.status != 200:
+                text = await response.text()
+                logger.error(f"❌ OpenAI API {response.status}: {text}")
+                raise RuntimeError(f"OpenAI error {response.status}: {text}")
+
+            yield response
+
+    @asynccontextmanager
+    async def _post(self, endpoint: str, payload: dict, timeout: int = 30):
+        """
+        POST-запрос генерации с учётом лимитов RPM/TPM
+        """
+        ticket = await self.limiter.wait(self._estimate_tokens(payload))
+
+        async with self._open("POST", endpoint, timeout, json=payload) as response:
+            yield response, ticket
+
+    async def _fetch(self, method: str, endpoint: str, timeout: int = 60, **kwargs) -> bytes:
+        """
+        Служебный запрос (файлы, батчи) без учёта лимитов генерации
+        """
+        async with self._open(method, endpoint, timeout, **kwargs) as response:
+            return await response.read()
+
+    async def _stream_request(self, endpoint: str, payload: dict, timeout: int = 30) -> str:
+        """
+        Потоковый запрос (stream=True): собирает текст из SSE-чанков по мере генерации
+        """
+        payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+        parts = []
+
+        async with self._post(endpoint, payload, timeout) as (response, ticket):
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+
+                chunk = json.loads(data)
+                for choice in chunk.get("choices") or []:
+                    parts.append(choice.get("delta", {}).get("content") or "")
 
-                if response.status != 200:
-                    logger.error(f"❌ OpenAI API {response.status}: {text}")
-                    raise RuntimeError(f"OpenAI error {response.status}: {text}")
+                # Последний чанк содержит фактический расход токенов
+                if chunk.get("usage"):
+                    self.limiter.record_usage(ticket, chunk["usage"]["total_tokens"])
 
-                return await response.json()
+        return "".join(parts)
 
     async def generate_text(
         self,
@@ -83,9 +242,11 @@ class OpenAIClient:
         model: str = "gpt-4o-mini",
         max_tokens: int = 300,
         temperature: float = 0.7,
+        timeout: int = 30,
     ) -> str:
         """
-        Асинхронная генерация текста через OpenAI GPT-4o-mini.
+        Асинхронная генерация текста через OpenAI GPT-4o-mini (потоковый ответ).
+        timeout ограничивает только HTTP-запрос, ожидание лимитов RPM/TPM в него не входит.
         """
         prompt = f"{settings.openai_prompt}\n\n{news_text}"
 
@@ -97,17 +258,18 @@ class OpenAIClient:
         }
 
         try:
-            data = await self._request("/chat/completions", payload)
-            return data["choices"][0]["message"]["content"].strip()
+            text = await self._stream_request("/chat/completions", payload, timeout)
+            return text.strip()
         except RateLimitError:
             raise
         except Exception as e:
-            logger.exception(f"❌ Ошибка генерации текста OpenAI: {e}")
+            logger.exception(f"❌ Ошибка генерации текста OpenAI: {e!r}")
             raise
 
-    async def generate_keywords(self, text: str, max_keywords: int = 4) -> List[str]:
+    @staticmethod
+    def keywords_payload(text: str, max_keywords: int = 4, model: str = "gpt-4o-mini") -> dict:
         """
-        Генерация ключевых слов из текста через OpenAI.
+        Тело запроса генерации ключевых слов (для обычного и пакетного режима).
         """
         prompt = (
             "Проанализируй предоставленный текст и составь список релевантных ключевых слов-тегов "
@@ -117,11 +279,75 @@ class OpenAIClient:
             "Предоставь только теги через запятую."
         )
 
-        response = await self.generate_text(prompt, max_tokens=100, temperature=0.3)
+        return {
+            "model": model,
+            "messages": [{"role": "user", "content": f"{settings.openai_prompt}\n\n{prompt}"}],
+            "max_tokens": 100,
+            "temperature": 0.3,
+        }
 
+    @staticmethod
+    def parse_keywords(response: str, max_keywords: int = 4) -> List[str]:
+        """
+        Разбирает ответ модели "тег1, тег2, ..." в список тегов.
+        """
         keywords = [word.strip() for word in response.split(",") if word.strip()]
         return keywords[:max_keywords]
 
+    # =========================
+    # Batch API
+    # =========================
+    async def create_batch(self, requests: list[dict], metadata: dict | None = None) -> dict:
+        """
+        Загружает запросы JSONL-файлом и создаёт батч /v1/chat/completions (окно 24ч).
+        """
+        content = "\n".join(json.dumps(request, ensure_ascii=False) for request in requests)
+
+        form = aiohttp.FormData()
+        form.add_field("purpose", "batch")
+        form.add_field("file", content.encode(), filename="batch.jsonl", content_type="application/jsonl")
+        input_file = json.loads(await self._fetch("POST", "/files", data=form))
+
+        return json.loads(await self._fetch("POST", "/batches", json={
+            "input_file_id": input_file["id"],
+            "endpoint": "/v1/chat/completions",
+            "completion_window": "24h",
+            "metadata": metadata or {},
+        }))
+
+    async def retrieve_batch(self, batch_id: str) -> dict:
+        """
+        Текущее состояние батча.
+        """
+        return json.loads(await self._fetch("GET", f"/batches/{batch_id}"))
+
+    async def cancel_batch(self, batch_id: str) -> dict:
+        """
+        Отменяет батч (если его не удалось поставить на учёт).
+        """
+        return json.loads(await self._fetch("POST", f"/batches/{batch_id}/cancel"))
+
+    async def batch_results(self, batch: dict) -> dict[str, str | None]:
+        """
+        Ответы батча: custom_id -> текст ответа (None, если запрос завершился ошибкой).
+        """
+        if not batch.get("output_file_id"):
+            return {}
+
+        content = await self._fetch("GET", f"/files/{batch['output_file_id']}/content")
+
+        results = {}
+        for line in content.decode().splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") == 200:
+                results[item["custom_id"]] = response["body"]["choices"][0]["message"]["content"].strip()
+            else:
+                results[item["custom_id"]] = None
+        return results
+
     async def health_client(self) -> dict:
         """
         Проверяет доступность OpenAI API через прокси (если задан).
@@ -132,18 +358,17 @@ class OpenAIClient:
         proxy_url = self._format_proxy()
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{self.BASE_URL}/models",
-                    headers={"Authorization": f"Bearer {self.api_key}"},
-                    proxy=proxy_url,
-                    timeout=aiohttp.ClientTimeout(total=5),
-                ) as response:
-                    if response.status == 200:
-                        return {"status": "ok"}
-                    else:
-                        text = await response.text()
-                        return {"status": "error", "detail": f"HTTP {response.status}: {text}"}
+            async with self._get_session().get(
+                f"{self.BASE_URL}/models",
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                proxy=proxy_url,
+                timeout=aiohttp.ClientTimeout(total=5),
+            ) as response:
+                if response.status == 200:
+                    return {"status": "ok"}
+                else:
+                    text = await response.text()
+                    return {"status": "error", "detail": f"HTTP {response.status}: {text}"}
         except Exception as e:
             logger.error(f"❌ Ошибка подключения к OpenAI: {e}")
             return {"status": "error", "detail": str(e)}
@@ -118,10 +118,10 @@ async def create_keyword(
     """
     try:
         # Проверка уникальности
-        exists = await session.execute(
-            select(Keyword).where(Keyword.word == payload.word)
+        exists = await session.scalar(
+            select(Keyword.id).where(Keyword.word == payload.word)
         )
-        if exists.scalar_one_or_none():
+        if exists:
             raise HTTPException(400, "Тег с таким словом уже существует")
 
         keyword = Keyword(word=payload.word)
@@ -160,10 +160,10 @@ async def update_keyword(
             raise HTTPException(404, "Тег не найден")
 
         # Проверка уникальности нового слова
-        exists = await session.execute(
-            select(Keyword).where(Keyword.word == payload.word)
+        exists = await session.scalar(
+            select(Keyword.id).where(Keyword.word == payload.word)
         )
-        if exists.scalar_one_or_none():
+        if exists:
             raise HTTPException(400, "Тег с таким словом уже существует")
 
         old_word = keyword.word
@@ -3,12 +3,13 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.dialects.sqlite import insert
 from sqlalchemy.orm import selectinload
 from uuid import UUID
 from typing import Optional
 
 from app.database import get_session
-from app.models import Post, Source, Keyword
+from app.models import Post, Source, Keyword, post_keywords
 from app.api.schemas import (
     PostSchema,
     PostStatusUpdateSchema,
@@ -115,25 +116,34 @@ async def attach_keywords_to_post(
         if not post:
             raise HTTPException(404, "Пост не найден")
 
-        attached = []
+        words = list(dict.fromkeys(word.strip().lower() for word in payload.keywords))
 
-        for word in payload.keywords:
-            word = word.strip().lower()
+        # Существующие теги одним запросом вместо SELECT на каждое слово
+        result = await session.execute(select(Keyword).where(Keyword.word.in_(words)))
+        existing = {keyword.word: keyword for keyword in result.scalars()}
 
-            result = await session.execute(select(Keyword).where(Keyword.word == word))
-            keyword = result.scalar_one_or_none()
+        new_keywords = [Keyword(word=word) for word in words if word not in existing]
+        if new_keywords:
+            session.add_all(new_keywords)
+            await session.flush()
+            existing.update((keyword.word, keyword) for keyword in new_keywords)
 
-            if not keyword:
-                keyword = Keyword(word=word)
-                session.add(keyword)
-                await session.flush()
+        current = {keyword.id for keyword in post.keywords}
+        attached = [word for word in words if existing[word].id not in current]
 
-            if keyword not in post.keywords:
-                post.keywords.append(keyword)
-                attached.append(word)
+        # Связи пост-тег одним INSERT вместо post.keywords.append на каждый тег
+        if attached:
+            await session.execute(
+                insert(post_keywords)
+                .values([
+                    {"post_id": post.id, "keyword_id": existing[word].id}
+                    for word in attached
+                ])
+                .on_conflict_do_nothing()
+            )
 
         await session.commit()
-        await session.refresh(post)
+        await session.refresh(post, ["keywords"])
 
         logger.info(f"🔗 Теги {attached} привязаны к посту {post_id}")
         return post
@@ -1,7 +1,19 @@
 # app/celery_app.py
+import asyncio
+import threading
+
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_init, worker_process_shutdown
 from app.config import settings
+from app.database import engine
+from app.ai.openai_client import openai_client
+from app.logger import logger
+
+try:
+    import uvloop
+except ImportError:  # uvloop не поддерживается на Windows
+    uvloop = None
 
 # ================================
 # Инициализация Celery
@@ -20,6 +32,7 @@ celery_app.conf.update(
     task_serializer="json",
     result_serializer="json",
     accept_content=["json"],
+    worker_concurrency=settings.celery_worker_concurrency,
 )
 
 celery_app.conf.timezone = "Europe/Moscow"
@@ -39,10 +52,15 @@ celery_app.conf.beat_schedule = {
         "task": "generate_posts",
         "schedule": crontab(minute="*/55"),
     },
-    # Генерация тегов для новых постов каждые 65 минут
-    "generate-post-keywords-every-65-minutes": {
-        "task": "generate_post_keywords",
-        "schedule": crontab(minute="*/65"),
+    # Отправка батча генерации тегов каждый час
+    "submit-keyword-batch-hourly": {
+        "task": "submit_keyword_batch",
+        "schedule": crontab(minute=0),
+    },
+    # Проверка готовности батчей тегов каждые 15 минут
+    "consume-keyword-batch-every-15-minutes": {
+        "task": "consume_keyword_batch",
+        "schedule": crontab(minute="*/15"),
     },
     # Очистка старых failed постов каждый день в 03:00
     "cleanup-old-failed-posts-daily": {
@@ -57,6 +75,78 @@ celery_app.conf.beat_schedule = {
     },
 }
 
+# ================================
+# Постоянный event loop воркера
+# ================================
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+_shutdown_callbacks = []
+
+
+def _start_loop() -> asyncio.AbstractEventLoop:
+    """
+    Запускает event loop (uvloop, если доступен) в фоновом потоке.
+    Loop создаётся один раз на процесс и живёт, пока жив воркер.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever,
+                name="celery-async-loop",
+                daemon=True,
+            ).start()
+            _loop = loop
+    return _loop
+
+
+def run_async(coro):
+    """
+    Выполняет корутину на постоянном loop воркера и возвращает результат.
+    Используется в Celery задачах вместо asyncio.run().
+    """
+    loop = _loop or _start_loop()
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def on_loop_shutdown(func):
+    """
+    Регистрирует async-функцию, которая выполнится на loop воркера
+    перед его остановкой (закрытие подключений и т.п.).
+    """
+    _shutdown_callbacks.append(func)
+    return func
+
+
+# Пул соединений БД и HTTP-сессия OpenAI закрываются вместе с воркером
+on_loop_shutdown(engine.dispose)
+on_loop_shutdown(openai_client.close)
+
+
+@worker_process_init.connect
+def _init_worker_loop(**kwargs):
+    # Соединения, унаследованные от родительского процесса после fork, не используем
+    engine.sync_engine.dispose(close=False)
+    _start_loop()
+    # HTTP-сессия создаётся на loop воркера и живёт вместе с ним
+    run_async(openai_client.start())
+
+
+@worker_process_shutdown.connect
+def _stop_worker_loop(**kwargs):
+    if _loop is None or not _loop.is_running():
+        return
+
+    for callback in _shutdown_callbacks:
+        try:
+            run_async(callback())
+        except Exception as e:
+            logger.error(f"❌ Ошибка при остановке воркера: {e}")
+
+    _loop.call_soon_threadsafe(_loop.stop)
+
+
 # ================================
 # Импорт всех задач
 # ================================
@@ -53,6 +53,7 @@ class Settings(BaseSettings):
     telegram_api_hash: str = Field("", alias="TELEGRAM_API_HASH")
     telegram_bot_token: str = Field("", alias="TELEGRAM_BOT_TOKEN")
     telegram_channel_id: str = Field("", alias="TELEGRAM_CHANNEL_ID")
+    telegram_bot_session: str = Field("", alias="TELEGRAM_BOT_SESSION")  # StringSession бота
 
     # OpenAI
     openai_api_key: str = Field("", alias="OPENAI_API_KEY")
@@ -61,6 +62,8 @@ class Settings(BaseSettings):
         "На основе следующей новости составь короткий и яркий пост для Telegram:",
         alias="OPENAI_PROMPT"
     )
+    openai_rpm: int = Field(500, alias="OPENAI_RPM")  # запросов в минуту
+    openai_tpm: int = Field(200_000, alias="OPENAI_TPM")  # токенов в минуту
 
     # Фильтры
     news_keywords: str = Field("python,fastapi,django", alias="NEWS_KEYWORDS")
@@ -74,6 +77,7 @@ class Settings(BaseSettings):
     redis_url: Optional[str] = Field(None, alias="REDIS_URL")
     celery_broker_url: Optional[str] = Field(None, alias="CELERY_BROKER_URL")
     celery_result_backend: Optional[str] = Field(None, alias="CELERY_RESULT_BACKEND")
+    celery_worker_concurrency: int = Field(4, alias="CELERY_WORKER_CONCURRENCY")
 
     @property
     def keywords_list(self) -> list[str]:
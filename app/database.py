@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import text
+from app.config import settings
 from app.logger import logger
 
 
@@ -11,10 +12,14 @@ from app.logger import logger
 DATABASE_URL = "sqlite+aiosqlite:///./aibot.db"
 
 # Создаём асинхронный движок SQLAlchemy
+# Пул соединений рассчитан на число параллельных задач воркера Celery
 engine = create_async_engine(
     DATABASE_URL,
     echo=True,  # True для логирования SQL-запросов
     future=True,
+    pool_size=settings.celery_worker_concurrency,
+    max_overflow=settings.celery_worker_concurrency,
+    pool_pre_ping=True,
 )
 
 # Создаём асинхронную сессию
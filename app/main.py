@@ -160,6 +160,13 @@ async def startup_event():
         logger.error(f"OpenAI client error: {e}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Событие остановки приложения.
+    """
+    await openai_client.close()
+
 
 # =====================================================
 # Health-check Celery + Beat
@@ -13,6 +13,7 @@ from sqlalchemy import (
     Table,
     Enum,
     Integer,
+    Index,
     func,
 )
 from sqlalchemy.orm import declarative_base, relationship
@@ -109,6 +110,10 @@ class NewsItem(Base):
 # =========================
 class Post(Base):
     __tablename__ = "posts"
+    __table_args__ = (
+        # cleanup_old_failed_posts: WHERE status = 'failed' AND created_at < ? ORDER BY created_at
+        Index("ix_posts_status_created_at", "status", "created_at"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     news_id = Column(String, ForeignKey("news_items.id"), nullable=False, unique=True)
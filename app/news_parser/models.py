@@ -0,0 +1,31 @@
+# app/news_parser/models.py
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+
+@dataclass(slots=True)
+class ParsedNews:
+    """
+    Новость, полученная парсером (до валидации и сохранения в БД).
+    Поля совпадают с ParsedNewsSchema.
+    """
+    title: str
+    url: str
+    summary: str
+    published_at: datetime | None
+    raw_text: str | None
+    source: str
+    source_type: str
+    source_url: str
+
+
+def to_utc(value: datetime | None) -> datetime | None:
+    """
+    Приводит дату публикации к UTC (naive-даты считаются UTC).
+    Все парсеры отдают published_at в одном часовом поясе.
+    """
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
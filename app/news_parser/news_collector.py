@@ -1,16 +1,16 @@
 # app/news_parser/news_collector.py
 import asyncio
 from typing import List
-from datetime import datetime
+from datetime import datetime, timezone
 
-from sqlalchemy import select
+from sqlalchemy import select, func
 
 from app.logger import logger
 from app.config import settings
 from app.news_parser import parser_habr, parser_rbk, parser_telegram
 from app.api.schemas import ParsedNewsSchema
 from app.database import async_session
-from app.models import Source
+from app.models import Source, NewsItem
 
 
 async def collect_news(limit_telegram: int = 50) -> List[ParsedNewsSchema]:
@@ -59,6 +59,14 @@ async def collect_news(limit_telegram: int = 50) -> List[ParsedNewsSchema]:
             result = await session.execute(select(Source).where(Source.enabled == True))
             sources = result.scalars().all()
 
+        # Дата последней сохранённой новости по каждому источнику
+        result = await session.execute(
+            select(Source.name, func.max(NewsItem.published_at))
+            .join(NewsItem, NewsItem.source_id == Source.id)
+            .group_by(Source.id)
+        )
+        last_published = dict(result.all())
+
     if not sources:
         logger.warning("⚠️ Нет активных источников для парсинга")
         return []
@@ -67,15 +75,20 @@ async def collect_news(limit_telegram: int = 50) -> List[ParsedNewsSchema]:
     # Формируем задачи парсеров динамически
     # -------------------------
     tasks = []
+    task_sources = []
     for src in sources:
         if not src.enabled:
             continue
+        since = last_published.get(src.name)
         if src.type == "site" and "habr" in src.name.lower():
-            tasks.append(parser_habr.parse_news_habr_site())
+            tasks.append(parser_habr.parse_news_habr_site(url=src.url, source_name=src.name, since=since))
         elif src.type == "site" and "rbc" in src.name.lower():
-            tasks.append(parser_rbk.parse_news_rbk_site())
+            tasks.append(parser_rbk.parse_news_rbk_site(url=src.url, source_name=src.name, since=since))
         elif src.type == "tg":
-            tasks.append(parser_telegram.parse_telegram_channel(limit=limit_telegram))
+            tasks.append(parser_telegram.parse_telegram_channel(limit=limit_telegram, channel=src.name))
+        else:
+            continue
+        task_sources.append(src.name)
 
     if not tasks:
         logger.warning("⚠️ Нет задач для парсеров")
@@ -90,9 +103,9 @@ async def collect_news(limit_telegram: int = 50) -> List[ParsedNewsSchema]:
     # Объединяем результаты
     # -------------------------
     raw_news = []
-    for source_news in results:
+    for source_name, source_news in zip(task_sources, results):
         if isinstance(source_news, Exception):
-            logger.error(f"❌ Ошибка источника: {source_news}")
+            logger.error(f"❌ Ошибка источника {source_name}: {source_news}")
             continue
         raw_news.extend(source_news)
 
@@ -104,7 +117,7 @@ async def collect_news(limit_telegram: int = 50) -> List[ParsedNewsSchema]:
     validated_news: List[ParsedNewsSchema] = []
     for item in raw_news:
         try:
-            validated = ParsedNewsSchema.model_validate(item)
+            validated = ParsedNewsSchema.model_validate(item, from_attributes=True)
             validated_news.append(validated)
         except Exception as e:
             logger.warning(f"⚠️ Новость пропущена (не прошла валидацию): {e}")
@@ -140,7 +153,8 @@ async def collect_news(limit_telegram: int = 50) -> List[ParsedNewsSchema]:
     # -------------------------
     # Сортировка по дате публикации (новые первыми)
     # -------------------------
-    filtered_news.sort(key=lambda x: x.published_at or datetime.min, reverse=True)
+    oldest = datetime.min.replace(tzinfo=timezone.utc)
+    filtered_news.sort(key=lambda x: x.published_at or oldest, reverse=True)
 
     return filtered_news
 
@@ -1,20 +1,29 @@
 # app/news_parser/parser_habr.py
 from bs4 import BeautifulSoup
-from typing import List, Dict
+from typing import List
 from datetime import datetime
 
 from app.logger import logger
 from app.news_parser.load_site import fetch_html
+from app.news_parser.models import ParsedNews, to_utc
 from app.config import settings
 from app.utils.rate_limit import random_delay
+from app.utils.text import shorten
 
 
-async def parse_news_habr_site(url: str = None, source_name: str = "habr.com") -> List[Dict]:
+async def parse_news_habr_site(
+    url: str = None,
+    source_name: str = "habr.com",
+    since: datetime | None = None,
+) -> List[ParsedNews]:
     """
     Парсинг новостей с Habr. Поддерживает динамическое указание URL.
 
     :param url: URL сайта для парсинга. Если None, берется из настроек.
     :param source_name: Название источника (для заполнения source)
+    :param since: Дата последней сохранённой новости источника.
+        Лента отсортирована от новых к старым, поэтому разбор
+        останавливается на первой статье не новее этой даты.
     """
     url = url or settings.habr_url
     html = await fetch_html(url)
@@ -26,14 +35,28 @@ async def parse_news_habr_site(url: str = None, source_name: str = "habr.com") -
     logger.info(f"🌐 Получен HTML код страницы {url}")
 
     soup = BeautifulSoup(html, "html.parser")
-    news_items: List[Dict] = []
+    news_items: List[ParsedNews] = []
 
     articles = soup.select("article.tm-articles-list__item")
     logger.info(f"Найдено статей: {len(articles)}")
 
     for item in articles:
-        await random_delay(0.8, 2.5)
         try:
+            # Парсинг даты публикации (до разбора остальных полей)
+            published_at = None
+            time_tag = item.find("time")
+            if time_tag and time_tag.get("datetime"):
+                try:
+                    published_at = to_utc(datetime.fromisoformat(time_tag.get("datetime").replace("Z", "+00:00")))
+                except ValueError:
+                    logger.warning(f"⚠️ Не удалось распарсить дату: {time_tag.get('datetime')}")
+
+            if since and published_at and published_at.replace(tzinfo=None) <= since:
+                logger.info(f"⏹ Дальше только уже сохранённые новости {source_name} (до {since})")
+                break
+
+            await random_delay(0.8, 2.5)
+
             title_tag = item.find("a", class_="tm-title__link")
             if not title_tag:
                 continue
@@ -53,27 +76,19 @@ async def parse_news_habr_site(url: str = None, source_name: str = "habr.com") -
             if not full_text or len(full_text) < 50:
                 continue
 
-            summary = full_text[:500] + "..." if len(full_text) > 500 else full_text
-
-            # Парсинг даты публикации
-            published_at = None
-            time_tag = item.find("time")
-            if time_tag and time_tag.get("datetime"):
-                try:
-                    published_at = datetime.fromisoformat(time_tag.get("datetime").replace("Z", "+00:00"))
-                except ValueError:
-                    logger.warning(f"⚠️ Не удалось распарсить дату: {time_tag.get('datetime')}")
+            summary = shorten(full_text, 500)
 
             news_items.append(
-                {
-                    "title": title,
-                    "url": url_full,
-                    "summary": summary,
-                    "published_at": published_at,
-                    "source": source_name,
-                    "source_type": "site",
-                    "source_url": url,
-                }
+                ParsedNews(
+                    title=title,
+                    url=url_full,
+                    summary=summary,
+                    published_at=published_at,
+                    raw_text=None,
+                    source=source_name,
+                    source_type="site",
+                    source_url=url,
+                )
             )
 
         except Exception:
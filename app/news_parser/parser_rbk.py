@@ -1,21 +1,193 @@
 # app/news_parser/parser_rbk.py
+import asyncio
+import lxml.html
+import soupsieve as sv
 from bs4 import BeautifulSoup
-from typing import List, Dict
+from lxml import etree
+from typing import List
 from datetime import datetime
 
 from app.logger import logger
 from app.news_parser.load_site import fetch_html
+from app.news_parser.models import ParsedNews, to_utc
 from app.config import settings
 from app.utils.rate_limit import random_delay
+from app.utils.text import shorten
 
+# Селекторы компилируются один раз при импорте модуля
+_RBC_ITEMS = sv.compile("div.item__wrap.l-col-center")
 
-async def parse_news_rbk_site(url: str = None, source_name: str = "rbc.ru") -> List[Dict]:
+# XPath для страницы статьи (разбирается через lxml без bs4)
+_RBC_ARTICLE_CONTENT = etree.XPath(
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' l-col-center-590 ')"
+    " and contains(concat(' ', normalize-space(@class), ' '), ' article__content ')]"
+)
+_RBC_ARTICLE_TEXT = etree.XPath(
+    ".//div[contains(concat(' ', normalize-space(@class), ' '), ' article__text ')]"
+)
+_RBC_ARTICLE_TIME = etree.XPath(".//time")
+
+# Параметры пула обработчиков статей
+RBC_WORKERS = 16
+RBC_QUEUE_SIZE = 64
+
+
+def _element_text(element) -> str:
+    """
+    Текст элемента без script/style, аналог bs4 get_text(strip=True).
+    """
+    for junk in element.xpath(".//script | .//style"):
+        junk.drop_tree()
+    return "".join(part.strip() for part in element.itertext())
+
+
+def _parse_article_sync(
+    html_article: str,
+    title: str,
+    href: str,
+    url: str,
+    source_name: str,
+) -> ParsedNews | None:
+    """
+    Разбор HTML страницы статьи RBC через lxml.
+    Возвращает None, если статья не подходит.
+    """
+    doc = lxml.html.fromstring(html_article)
+
+    content = _RBC_ARTICLE_CONTENT(doc)
+    if not content:
+        return None
+    content_tag = content[0]
+
+    text_block = _RBC_ARTICLE_TEXT(content_tag)
+    if not text_block:
+        return None
+
+    full_text = _element_text(text_block[0])
+    if not full_text or len(full_text) < 50:
+        return None
+
+    summary = shorten(full_text, 400)
+
+    # Парсинг даты публикации
+    published_at = None
+    time_tags = _RBC_ARTICLE_TIME(content_tag)
+    raw_date = time_tags[0].get("datetime") if time_tags else None
+    if raw_date:
+        try:
+            published_at = to_utc(datetime.fromisoformat(raw_date.replace("Z", "+00:00")))
+        except ValueError:
+            logger.warning(f"⚠️ Не удалось распарсить дату {source_name}: {raw_date}")
+
+    return ParsedNews(
+        title=title,
+        url=href,
+        summary=summary,
+        published_at=published_at,
+        raw_text=full_text,
+        source=source_name,
+        source_type="site",
+        source_url=url,
+    )
+
+
+async def _fetch_and_parse(title: str, href: str, url: str, source_name: str) -> ParsedNews | None:
+    """
+    Загружает страницу статьи RBC и собирает из неё ParsedNews.
+    Возвращает None, если статья не подходит или не удалось её разобрать.
+    """
+    await random_delay(2.0, 5.0)
+
+    try:
+        html_article = await fetch_html(href)
+        if not html_article:
+            return None
+
+        return _parse_article_sync(html_article, title, href, url, source_name)
+
+    except Exception:
+        logger.exception(f"❌ Ошибка при разборе статьи {source_name}")
+        return None
+
+
+async def _produce_links(articles, queue: asyncio.Queue, stop: asyncio.Event) -> None:
+    """
+    Producer: кладёт в очередь пары (title, href) из списка статей,
+    в конце — по одному sentinel None на каждого обработчика.
+    Прекращает работу, как только выставлен stop.
+    """
+    try:
+        for item in articles:
+            if stop.is_set():
+                break
+
+            title_tag = item.find("a", class_="item__link")
+            if not title_tag:
+                continue
+
+            title = title_tag.get_text(strip=True)[:300]
+            href = title_tag.get("href")
+            if not title or not href or not href.startswith("http"):
+                continue
+
+            await queue.put((title, href))
+    finally:
+        for _ in range(RBC_WORKERS):
+            await queue.put(None)
+
+
+async def _article_worker(
+    queue: asyncio.Queue,
+    results: asyncio.Queue,
+    url: str,
+    source_name: str,
+    since: datetime | None,
+    stop: asyncio.Event,
+) -> None:
+    """
+    Consumer: забирает ссылки из очереди, загружает и разбирает статьи.
+    Встретив статью не новее since, выставляет stop: лента отсортирована
+    от новых к старым, поэтому оставшиеся в очереди ссылки пропускаются.
+    По завершении кладёт None в очередь результатов.
+    """
+    try:
+        while True:
+            job = await queue.get()
+            if job is None:
+                break
+            if stop.is_set():
+                continue
+
+            title, href = job
+            news = await _fetch_and_parse(title, href, url, source_name)
+            if not news:
+                continue
+
+            if since and news.published_at and news.published_at.replace(tzinfo=None) <= since:
+                if not stop.is_set():
+                    logger.info(f"⏹ Дальше только уже сохранённые новости {source_name} (до {since})")
+                    stop.set()
+                continue
+
+            await results.put(news)
+    finally:
+        await results.put(None)
+
+
+async def parse_news_rbk_site(
+    url: str = None,
+    source_name: str = "rbc.ru",
+    since: datetime | None = None,
+) -> List[ParsedNews]:
     """
     Парсинг новостей с RBC. Поддерживает динамическое указание URL и source_name.
+    Статьи загружаются пулом из RBC_WORKERS обработчиков через ограниченную очередь.
 
     :param url: URL сайта для парсинга. Если None, берется из настроек.
     :param source_name: Название источника (для заполнения source)
-    :return: Список словарей в формате ParsedNewsSchema
+    :param since: Дата последней сохранённой новости источника.
+        Статьи не новее этой даты не загружаются.
+    :return: Список ParsedNews
     """
     url = url or settings.rbc_url
     html = await fetch_html(url)
@@ -27,74 +199,37 @@ async def parse_news_rbk_site(url: str = None, source_name: str = "rbc.ru") -> L
     logger.info(f"🌐 Получен HTML код страницы {url}")
 
     soup = BeautifulSoup(html, "html.parser")
-    news_items: List[Dict] = []
+    news_items: List[ParsedNews] = []
 
     main_content = soup.select_one(".l-col-main")
     if not main_content:
         logger.warning(f"⚠️ Не найден основной контейнер {source_name}")
         return []
 
-    articles = main_content.find_all("div", class_="item__wrap l-col-center")
+    articles = _RBC_ITEMS.select(main_content)
     logger.info(f"Найдено статей {source_name}: {len(articles)}")
 
-    for item in articles:
-        await random_delay(2.0, 5.0)
+    queue: asyncio.Queue[tuple[str, str] | None] = asyncio.Queue(maxsize=RBC_QUEUE_SIZE)
+    results: asyncio.Queue[ParsedNews | None] = asyncio.Queue()
 
-        try:
-            title_tag = item.find("a", class_="item__link")
-            if not title_tag:
-                continue
-
-            title = title_tag.get_text(strip=True)[:300]
-            href = title_tag.get("href")
-            if not title or not href or not href.startswith("http"):
-                continue
+    stop = asyncio.Event()
 
-            html_article = await fetch_html(href)
-            if not html_article:
-                continue
+    producer = asyncio.create_task(_produce_links(articles, queue, stop))
+    workers = [
+        asyncio.create_task(_article_worker(queue, results, url, source_name, since, stop))
+        for _ in range(RBC_WORKERS)
+    ]
 
-            article_soup = BeautifulSoup(html_article, "html.parser")
-            content_tag = article_soup.find("div", class_="l-col-center-590 article__content")
-            if not content_tag:
-                continue
-
-            text_block = content_tag.find("div", class_="article__text")
-            if not text_block:
-                continue
-
-            full_text = text_block.get_text(strip=True)
-            if not full_text or len(full_text) < 50:
-                continue
-
-            summary = full_text[:400] + "..." if len(full_text) > 400 else full_text
-
-            # Парсинг даты публикации
-            published_at = None
-            time_tag = content_tag.find("time")
-            if time_tag and time_tag.get("datetime"):
-                try:
-                    published_at = datetime.fromisoformat(time_tag.get("datetime").replace("Z", "+00:00"))
-                except ValueError:
-                    logger.warning(f"⚠️ Не удалось распарсить дату {source_name}: {time_tag.get('datetime')}")
-
-            news_items.append(
-                {
-                    "title": title,
-                    "url": href,
-                    "summary": summary,
-                    "published_at": published_at,
-                    "raw_text": full_text,
-                    "source": source_name,
-                    "source_type": "site",
-                    "source_url": url,
-                }
-            )
-
-        except Exception:
-            logger.exception(f"❌ Ошибка при разборе статьи {source_name}")
+    # Собираем результаты, пока все обработчики не сообщат о завершении
+    finished = 0
+    while finished < len(workers):
+        news = await results.get()
+        if news is None:
+            finished += 1
             continue
+        news_items.append(news)
+
+    await producer
 
     logger.info(f"✅ Успешно спарсено новостей {source_name}: {len(news_items)}")
     return news_items
-
@@ -1,16 +1,61 @@
 # app/news_parser/parser_telegram.py
-from typing import List, Dict
-from datetime import datetime
+from collections import OrderedDict
+from typing import List
 
 from telethon import TelegramClient
 from telethon.errors import FloodWaitError
 
 from app.config import settings
 from app.logger import logger
-from app.utils.rate_limit import random_delay
+from app.news_parser.models import ParsedNews, to_utc
+from app.news_parser.state import get_last_id, set_last_id
+from app.utils.telegram_client import SharedTelegramClient
 
+# Клиент Telethon работает с файловой сессией telegram_parser_session. Держать его
+# подключённым между задачами можно, только если процесс воркера один: несколько
+# процессов на одном файле сессии ловят "database is locked" и делят auth key.
+# По фактическому пулу воркера флаг выставляется в app/tasks/news_tasks.py (worker_init).
+KEEP_CLIENT = True
 
-async def parse_telegram_channel(limit: int = 50, channel: str = None) -> List[Dict]:
+# Клиент Telethon переиспользуется между вызовами (одно подключение на процесс)
+parser_client = SharedTelegramClient(
+    "Telegram parser client",
+    lambda: TelegramClient("telegram_parser_session", settings.telegram_api_id, settings.telegram_api_hash),
+)
+
+# Уже обработанные message.id по каналам (ограниченный LRU, старые вытесняются)
+SEEN_MAX = 1000
+_seen: dict[str, OrderedDict[int, None]] = {}
+
+# Прочитанное, но ещё не сохранённое в БД: канал -> (новый last_id или None, id сообщений).
+# Фиксируется в Redis и в _seen только после commit новостей (commit_read_state)
+_pending: dict[str, tuple[int | None, list[int]]] = {}
+
+
+async def commit_read_state():
+    """
+    Фиксирует прочитанные сообщения (last_id в Redis и LRU) после сохранения новостей.
+    """
+    pending = dict(_pending)
+    _pending.clear()
+
+    for channel, (last_id, read_ids) in pending.items():
+        seen = _seen.setdefault(channel, OrderedDict())
+        for message_id in read_ids:
+            seen[message_id] = None
+        while len(seen) > SEEN_MAX:
+            seen.popitem(last=False)
+
+        if last_id:
+            await set_last_id(channel, last_id)
+
+
+def discard_read_state():
+    """Сбрасывает прочитанное, но не сохранённое (например, после ошибки записи в БД)."""
+    _pending.clear()
+
+
+async def parse_telegram_channel(limit: int = 50, channel: str = None) -> List[ParsedNews]:
     """
     Парсинг новостей из Telegram-канала.
     Поддерживает динамическое указание канала через аргумент channel.
@@ -26,41 +71,68 @@ async def parse_telegram_channel(limit: int = 50, channel: str = None) -> List[D
         logger.error("❌ Не заданы TELEGRAM_API_ID или TELEGRAM_API_HASH")
         return []
 
-    news_items: List[Dict] = []
-
-    async with TelegramClient("telegram_parser_session", api_id, api_hash) as client:
-        logger.info(f"📡 Подключение к Telegram каналу: {channel}")
-
-        try:
-            async for message in client.iter_messages(channel, limit=min(limit, 60)):
-                await random_delay(1.0, 2.5)
-
-                if not message.text or len(message.text.strip()) < 30:
-                    continue
-
-                text = message.text.strip()
-                title = text.split("\n")[0][:200]
-                summary = text[:500]
-
-                published_at = message.date if message.date else None
-
-                news_items.append(
-                    {
-                        "title": title,
-                        "url": f"https://t.me/{channel}/{message.id}",
-                        "summary": summary,
-                        "published_at": published_at,
-                        "raw_text": text,
-                        "source": channel,
-                        "source_type": "tg",
-                        "source_url": f"https://t.me/{channel}",
-                    }
+    news_items: List[ParsedNews] = []
+    channel_url = f"https://t.me/{channel}"
+
+    client = await parser_client.get()
+    logger.info(f"📡 Подключение к Telegram каналу: {channel}")
+
+    seen = _seen.setdefault(channel, OrderedDict())
+
+    # Читаем только сообщения новее последнего обработанного
+    last_id = await get_last_id(channel)
+    kwargs = {"min_id": last_id} if last_id else {}
+    max_id = last_id or 0
+    read_ids: list[int] = []
+    clean = False
+
+    try:
+        # Telethon сам запрашивает историю пачками и соблюдает FloodWait,
+        # поэтому задержка между сообщениями не нужна
+        async for message in client.iter_messages(channel, limit=min(limit, 60), **kwargs):
+            max_id = max(max_id, message.id)
+
+            if message.id in seen:
+                continue
+            read_ids.append(message.id)
+
+            raw = message.text
+            if not raw:
+                continue
+
+            text = raw.strip()
+            if len(text) < 30:
+                continue
+
+            # Заголовок — первая строка, но не длиннее 200 символов
+            nl = text.find("\n")
+            title = text[:nl if 0 <= nl < 200 else 200]
+            summary = text[:500]
+
+            published_at = to_utc(message.date)
+
+            news_items.append(
+                ParsedNews(
+                    title=title,
+                    url=f"{channel_url}/{message.id}",
+                    summary=summary,
+                    published_at=published_at,
+                    raw_text=text,
+                    source=channel,
+                    source_type="tg",
+                    source_url=channel_url,
                 )
+            )
+        clean = True
+
+    except FloodWaitError as e:
+        logger.warning(f"⏱ Телеграм просит ждать {e.seconds} секунд")
+    except Exception as e:
+        logger.exception(f"❌ Ошибка при чтении канала {channel}: {e}")
 
-        except FloodWaitError as e:
-            logger.warning(f"⏱ Телеграм просит ждать {e.seconds} секунд")
-        except Exception as e:
-            logger.exception(f"❌ Ошибка при чтении канала {channel}: {e}")
+    # last_id сдвигаем только после полного прохода: иначе непрочитанный хвост потеряется
+    new_last_id = max_id if clean and max_id and max_id != last_id else None
+    _pending[channel] = (new_last_id, read_ids)
 
     logger.info(f"✅ Успешно спарсено сообщений Telegram: {len(news_items)}")
     return news_items
@@ -0,0 +1,42 @@
+# app/news_parser/state.py
+import redis.asyncio as redis
+
+from app.config import settings
+from app.logger import logger
+
+KEY_PREFIX = "telegram:last_message_id:"
+
+
+async def get_last_id(channel: str) -> int | None:
+    """
+    Возвращает id последнего обработанного сообщения канала из Redis.
+    Если Redis не настроен или недоступен — None (читаем канал целиком).
+    """
+    if not settings.redis_url:
+        return None
+
+    try:
+        client = redis.from_url(settings.redis_url)
+        try:
+            value = await client.get(KEY_PREFIX + channel)
+        finally:
+            await client.aclose()
+        return int(value) if value else None
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось получить last_id канала {channel} из Redis: {e}")
+        return None
+
+
+async def set_last_id(channel: str, message_id: int):
+    """Сохраняет id последнего обработанного сообщения канала в Redis."""
+    if not settings.redis_url:
+        return
+
+    try:
+        client = redis.from_url(settings.redis_url)
+        try:
+            await client.set(KEY_PREFIX + channel, message_id)
+        finally:
+            await client.aclose()
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось сохранить last_id канала {channel} в Redis: {e}")
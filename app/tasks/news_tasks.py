@@ -1,11 +1,34 @@
 # app/tasks/news_tasks.py
-import asyncio
-from app.celery_app import celery_app
+from cachetools import TTLCache
+from celery.concurrency import get_implementation
+from celery.concurrency.prefork import TaskPool as PreforkPool
+from celery.signals import worker_init
+from app.celery_app import celery_app, run_async, on_loop_shutdown
 from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
 from app.database import async_session
 from app.models import NewsItem, Source
 from app.logger import logger
-from app.news_parser import news_collector
+from app.news_parser import news_collector, parser_telegram
+
+# Общий клиент Telethon закрывается вместе с воркером (если держится между задачами)
+on_loop_shutdown(parser_telegram.parser_client.disconnect)
+
+
+@worker_init.connect
+def _choose_telegram_client_mode(sender=None, **kwargs):
+    """
+    Решает, держать ли клиент Telethon между задачами, по фактическому пулу воркера
+    (с учётом -P/-c из командной строки). Сигнал приходит в главном процессе до fork,
+    поэтому процессы prefork-пула наследуют флаг.
+    """
+    pool_cls = get_implementation(sender.pool_cls or celery_app.conf.worker_pool)
+    processes = sender.concurrency if issubclass(pool_cls, PreforkPool) else 1
+    parser_telegram.KEEP_CLIENT = processes == 1
+    logger.info(f"📡 Клиент Telegram-парсера между задачами: {'держим' if parser_telegram.KEEP_CLIENT else 'отключаем'}")
+
+# Кэш source.name -> source.id на процесс воркера
+SRC_CACHE: TTLCache[str, str] = TTLCache(maxsize=256, ttl=600)
 
 
 @celery_app.task(name="parse_and_save_news")
@@ -17,60 +40,74 @@ def parse_and_save_news(limit_telegram: int = 50):
 
     """
     async def _main():
-        news_list = await news_collector.collect_news(limit_telegram=limit_telegram)
+        # Остатки прошлой задачи, упавшей до commit, не фиксируем
+        parser_telegram.discard_read_state()
+        try:
+            news_list = await news_collector.collect_news(limit_telegram=limit_telegram)
+        finally:
+            # При нескольких процессах воркера сессия Telethon занята только на время задачи
+            if not parser_telegram.KEEP_CLIENT:
+                await parser_telegram.parser_client.disconnect()
+
         if not news_list:
             logger.warning("⚠️ Новости не собраны")
+            await parser_telegram.commit_read_state()
             return 0
 
         async with async_session() as session:
-            saved_count = 0
-
-            # Получаем все источники заранее
-            result = await session.execute(select(Source))
-            sources = result.scalars().all()
-            sources_dict = {src.name: src for src in sources}
+            # Источники, созданные в этой задаче: в кэш попадут после commit
+            new_sources: dict[str, str] = {}
 
+            rows = []
             for news in news_list:
                 source_name = news.source
 
                 # --- Получаем или создаём Source ---
-                source_obj = sources_dict.get(source_name)
-                if not source_obj:
-                    source_obj = Source(
-                        name=news.source,
-                        type=news.source_type.value,
-                        url=news.source_url,
-                        enabled=True  # новые источники сразу активны
+                source_id = SRC_CACHE.get(source_name) or new_sources.get(source_name)
+                if not source_id:
+                    source_id = await session.scalar(
+                        select(Source.id).where(Source.name == source_name)
                     )
-                    session.add(source_obj)
-                    await session.flush()
-                    sources_dict[source_name] = source_obj
-                    logger.info(f"🆕 Создан новый источник: {source_obj.name} ({source_obj.type})")
-
-                # --- Проверка дубликата по URL ---
-                result = await session.execute(
-                    select(NewsItem).where(NewsItem.url == str(news.url))
-                )
-                existing_news = result.scalar_one_or_none()
-                if existing_news:
-                    continue
-
-                # --- Создание NewsItem ---
-                news_obj = NewsItem(
-                    title=news.title or "Без заголовка",
-                    url=str(news.url),
-                    summary=news.summary or "",
-                    source_id=source_obj.id,
-                    published_at=news.published_at,
-                    raw_text=news.raw_text,
-                )
-
-                session.add(news_obj)
-                saved_count += 1
+                    if source_id:
+                        SRC_CACHE[source_name] = source_id
+                    else:
+                        source_id = await session.scalar(
+                            insert(Source)
+                            .values(
+                                name=source_name,
+                                type=news.source_type.value,
+                                url=news.source_url,
+                                enabled=True,  # новые источники сразу активны
+                            )
+                            .returning(Source.id)
+                        )
+                        new_sources[source_name] = source_id
+                        logger.info(f"🆕 Создан новый источник: {source_name} ({news.source_type.value})")
+
+                rows.append({
+                    "title": news.title or "Без заголовка",
+                    "url": str(news.url),
+                    "summary": news.summary or "",
+                    "source_id": source_id,
+                    "published_at": news.published_at,
+                    "raw_text": news.raw_text,
+                })
+
+            # --- Один INSERT на все новости, дубликаты по URL пропускаются ---
+            result = await session.execute(
+                insert(NewsItem)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=["url"])
+            )
+            saved_count = result.rowcount
 
             await session.commit()
-            return saved_count
+            SRC_CACHE.update(new_sources)
+
+        # Позиции каналов сдвигаются только после того, как новости записаны в БД
+        await parser_telegram.commit_read_state()
+        return saved_count
 
-    count = asyncio.run(_main())
+    count = run_async(_main())
     logger.info(f"✅ Сохранено новостей: {count}")
     return count
@@ -1,22 +1,34 @@
 # app/tasks/post_tasks.py
 
 import asyncio
-from datetime import datetime, timedelta
-from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import selectinload
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, delete, or_, and_, func
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import selectinload, raiseload
 
-from app.celery_app import celery_app
+from app.celery_app import celery_app, run_async
 from app.database import async_session
-from app.models import NewsItem, Post, PostStatus, Keyword
+from app.models import NewsItem, Post, PostStatus, Keyword, post_keywords
+from app.config import settings
 from app.logger import logger
-from app.ai.openai_client import openai_client, RateLimitError
-from app.utils.rate_limit import CyclicRateLimiter
+from app.ai.openai_client import openai_client, RateLimitError, ServerError, RETRYABLE_ERRORS
+from app.ai.batch_state import get_pending_batches, add_pending_batch, remove_pending_batch
+from app.utils.atb import AdaptiveTokenBucket
+from app.utils.rate_limit import AIMDController, backoff
 
 MAX_RETRIES = 3
 MAX_PER_RUN = 3
 MAX_DELETE_PER_RUN = 20
 MIN_TEXT_LENGTH = 20  # минимальная длина сгенерированного текста
+OPENAI_CONCURRENCY = 3  # стартовое число одновременных запросов к OpenAI
+OPENAI_TIMEOUT = 30  # таймаут одного запроса генерации, сек
+OPENAI_ATTEMPTS = 3  # попыток запроса к OpenAI при временных ошибках
+
+# Общие для задач регуляторы запросов к OpenAI (живут в процессе воркера,
+# поэтому набранная скорость и параллельность сохраняются между запусками)
+openai_concurrency = AIMDController(c_min=1, c_max=16, c0=OPENAI_CONCURRENCY, alpha=0.5, beta=0.5)
+openai_bucket = AdaptiveTokenBucket(r0=0.2, cap=2.0, alpha=1.1, beta=2.0)
 
 
 # =========================
@@ -26,51 +38,80 @@ MIN_TEXT_LENGTH = 20  # минимальная длина сгенерирова
 def generate_posts():
     async def _main():
         async with async_session() as session:
-            news_list = (await session.execute(
-                select(NewsItem).limit(MAX_PER_RUN * 5)
-            )).scalars().all()
-
+            # Новости с текстом: без поста, с постом на перегенерацию (generated),
+            # с ещё не сгенерированным new или с failed, у которого остались попытки.
+            # failed посты с исчерпанными попытками не берём — их удалит cleanup_old_failed_posts
+            rows = (await session.execute(
+                select(NewsItem, Post)
+                .outerjoin(Post, Post.news_id == NewsItem.id)
+                .where(or_(
+                    Post.id.is_(None),
+                    Post.status == PostStatus.generated,
+                    and_(Post.status == PostStatus.new, Post.generated_text.is_(None)),
+                    and_(Post.status == PostStatus.failed, Post.retry_count < MAX_RETRIES),
+                ))
+                .where(func.coalesce(
+                    func.nullif(func.trim(NewsItem.raw_text), ""),
+                    func.nullif(func.trim(NewsItem.summary), ""),
+                ).is_not(None))
+                .options(raiseload("*"))  # связи здесь не нужны, ленивые загрузки запрещены
+                .order_by(NewsItem.published_at.desc())  # сначала свежие новости
+                .limit(MAX_PER_RUN)
+            )).all()
+
+            if not rows:
+                logger.info("🟡 Нет новостей для генерации постов")
+                return 0
+
+            candidates = [
+                (news, post, (news.raw_text or "").strip() or news.summary.strip())
+                for news, post in rows
+            ]
+
+            # --- Параллельная генерация, число запросов регулирует openai_concurrency ---
+            async def _gen_one(text_source: str) -> str:
+                async with openai_concurrency.slot():
+                    for attempt in range(OPENAI_ATTEMPTS):
+                        await openai_bucket.acquire()
+                        started = time.monotonic()
+                        try:
+                            # Таймаут только на сам HTTP-запрос: паузы лимитера им не считаются
+                            generated_text = await openai_client.generate_text(
+                                text_source, timeout=OPENAI_TIMEOUT
+                            )
+                        except RETRYABLE_ERRORS as e:
+                            if isinstance(e, RateLimitError):
+                                openai_bucket.on_fail(e.retry_after)
+                            if isinstance(e, (RateLimitError, ServerError)):
+                                # 429 и 5xx — признак перегрузки: уменьшаем параллелизм
+                                openai_concurrency.on_error()
+                            if attempt == OPENAI_ATTEMPTS - 1:
+                                raise
+                            logger.warning(f"🔁 Повтор запроса OpenAI ({attempt + 1}/{OPENAI_ATTEMPTS}): {e!r}")
+                            await backoff(attempt)
+                            continue
+                        openai_bucket.on_success()
+                        openai_concurrency.on_sample(time.monotonic() - started)
+                        return generated_text
+
+            results = await asyncio.gather(
+                *[_gen_one(text_source) for _, _, text_source in candidates],
+                return_exceptions=True,
+            )
+
+            # --- Изменения в БД применяем последовательно ---
             generated_count = 0
-            rate_limiter = CyclicRateLimiter(burst=3, interval=20, cooldown=60)
-
-            for news in news_list:
-                if generated_count >= MAX_PER_RUN:
-                    break
-
-                post = (await session.execute(
-                    select(Post).where(Post.news_id == news.id)
-                )).scalar_one_or_none()
-
-                # Пропускаем опубликованные
-                if post and post.status == PostStatus.published:
-                    continue
-
-                # Архивируем failed, если превышен лимит retry
-                if post and post.status == PostStatus.failed and post.retry_count >= MAX_RETRIES:
-                    logger.info(f"📦 Архивирован failed пост: {news.id}")
-                    post.status = PostStatus.archived
-                    continue
-
-                # Проверка источника текста
-                text_source = (news.raw_text or news.summary or "").strip()
-                if not text_source:
-                    logger.warning(f"🟡 Пропущена пустая новость {news.id}")
-                    continue
-
-                try:
-                    await rate_limiter.wait()
-                    generated_text = await openai_client.generate_text(text_source)
-
-                except RateLimitError as e:
-                    logger.warning(f"⏳ Rate limit для {news.id}: {e}, ждём 60 сек")
-                    await asyncio.sleep(60)
+            for (news, post, _), generated_text in zip(candidates, results):
+                if isinstance(generated_text, RateLimitError):
+                    logger.warning(f"⏳ Rate limit для {news.id}: {generated_text}")
                     continue
 
-                except Exception as e:
-                    logger.warning(f"⚠️ Ошибка генерации для {news.id}: {e}")
+                if isinstance(generated_text, Exception):
+                    e = generated_text
+                    logger.warning(f"⚠️ Ошибка генерации для {news.id}: {e!r}")
                     if post:
                         post.retry_count += 1
-                        post.error_message = str(e)
+                        post.error_message = repr(e)  # у TimeoutError пустой str()
                         if post.retry_count >= MAX_RETRIES:
                             post.status = PostStatus.failed
                     else:
@@ -78,7 +119,7 @@ def generate_posts():
                             news_id=news.id,
                             status=PostStatus.failed,
                             retry_count=1,
-                            error_message=str(e)
+                            error_message=repr(e)
                         ))
                     continue
 
@@ -122,7 +163,7 @@ def generate_posts():
             await session.commit()
             return generated_count
 
-    return asyncio.run(_main())
+    return run_async(_main())
 
 
 # =========================
@@ -132,88 +173,205 @@ def generate_posts():
 def cleanup_old_failed_posts(days: int = 7):
     async def _main():
         async with async_session() as session:
-            cutoff = datetime.utcnow() - timedelta(days=days)
-            posts = (await session.execute(
-                select(Post).where(
+            cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+            # Не больше MAX_DELETE_PER_RUN самых старых failed постов
+            rows = (await session.execute(
+                select(Post.id, Post.news_id)
+                .where(
                     Post.status == PostStatus.failed,
                     Post.created_at < cutoff
                 )
-            )).scalars().all()
-
-            deleted_count = 0
-            for post in posts[:MAX_DELETE_PER_RUN]:
-                await session.delete(post)
-                deleted_count += 1
+                .order_by(Post.created_at)
+                .limit(MAX_DELETE_PER_RUN)
+            )).all()
+            if not rows:
+                return 0
+
+            post_ids = [post_id for post_id, _ in rows]
+            news_ids = [news_id for _, news_id in rows]
+
+            # Сначала связи с тегами и посты (ссылаются на новости), затем их новости —
+            # по одному DELETE (bulk DELETE не чистит post_keywords, как session.delete)
+            await session.execute(
+                delete(post_keywords).where(post_keywords.c.post_id.in_(post_ids))
+            )
+
+            result = await session.execute(
+                delete(Post)
+                .where(Post.id.in_(post_ids))
+                .execution_options(synchronize_session=False)
+            )
+            deleted_count = result.rowcount
+
+            await session.execute(
+                delete(NewsItem)
+                .where(NewsItem.id.in_(news_ids))
+                .execution_options(synchronize_session=False)
+            )
 
             await session.commit()
             return deleted_count
 
-    return asyncio.run(_main())
+    return run_async(_main())
 
 
 # =========================
-# Генерация ключевых слов
+# Генерация ключевых слов (OpenAI Batch API)
 # =========================
-@celery_app.task(name="generate_post_keywords")
-def generate_post_keywords():
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+async def _save_keywords(session, post_id: str, keywords: list[str]):
+    """Привязывает теги к посту, создавая недостающие Keyword."""
+    words = list(dict.fromkeys(keywords))
+
+    # Один INSERT на все теги поста, существующие слова пропускаются
+    keyword_ids = {
+        word: keyword_id
+        for keyword_id, word in (await session.execute(
+            insert(Keyword)
+            .values([{"word": word} for word in words])
+            .on_conflict_do_nothing(index_elements=["word"])
+            .returning(Keyword.id, Keyword.word)
+        )).all()
+    }
+
+    # Теги, которые уже были в базе, дочитываем одним запросом
+    missing = set(words) - keyword_ids.keys()
+    if missing:
+        keyword_ids.update(
+            (word, keyword_id)
+            for keyword_id, word in (await session.execute(
+                select(Keyword.id, Keyword.word).where(Keyword.word.in_(missing))
+            )).all()
+        )
+
+    # Связи пост-тег одним INSERT, уже существующие пропускаются
+    await session.execute(
+        insert(post_keywords)
+        .values([
+            {"post_id": post_id, "keyword_id": keyword_id}
+            for keyword_id in keyword_ids.values()
+        ])
+        .on_conflict_do_nothing()
+    )
+
+
+@celery_app.task(name="submit_keyword_batch")
+def submit_keyword_batch():
     async def _main():
+        if not settings.redis_url:
+            logger.warning("🟡 REDIS_URL не задан, пакетная генерация тегов недоступна")
+            return 0
+
+        # Посты, уже отправленные в незавершённые батчи, повторно не отправляем
+        pending = await get_pending_batches()
+        pending_ids = {post_id for post_ids in pending.values() for post_id in post_ids}
+
         async with async_session() as session:
             posts = (await session.execute(
                 select(Post)
-                .options(selectinload(Post.keywords))
+                .options(selectinload(Post.keywords), raiseload("*"))  # новость не нужна, текст берётся из поста
                 .where(Post.status.in_([PostStatus.new, PostStatus.generated]))
             )).scalars().all()
 
-            updated_count = 0
-            rate_limiter = CyclicRateLimiter(burst=3, interval=20, cooldown=60)
+        # --- Отбор постов без тегов ---
+        requests = []
+        for post in posts:
+            if post.keywords or post.id in pending_ids:
+                continue
+
+            text = (post.generated_text or "").strip()
+            if not text:
+                logger.warning(f"🟡 Пропущен пост {post.id}, пустой текст")
+                continue
+
+            requests.append({
+                "custom_id": post.id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": openai_client.keywords_payload(text),
+            })
+
+        if not requests:
+            logger.info("🟡 Нет постов без тегов")
+            return 0
+
+        try:
+            batch = await openai_client.create_batch(requests, metadata={"task": "post_keywords"})
+        except Exception as e:
+            logger.error(f"❌ Не удалось создать батч тегов: {e}")
+            return 0
+
+        try:
+            await add_pending_batch(batch["id"], [request["custom_id"] for request in requests])
+        except Exception as e:
+            # Без записи в Redis батч никто не заберёт, а посты уйдут повторно — отменяем его
+            logger.error(f"❌ Не удалось сохранить батч {batch['id']}, отменяем: {e}")
+            try:
+                await openai_client.cancel_batch(batch["id"])
+            except Exception as cancel_error:
+                logger.error(f"❌ Не удалось отменить батч {batch['id']}: {cancel_error}")
+            raise
+
+        logger.info(f"📦 Отправлен батч тегов {batch['id']} ({len(requests)} постов)")
+        return len(requests)
+
+    return run_async(_main())
+
+
+@celery_app.task(name="consume_keyword_batch")
+def consume_keyword_batch():
+    async def _main():
+        pending = await get_pending_batches()
+        if not pending:
+            logger.info("🟡 Нет батчей тегов в обработке")
+            return 0
 
-            for post in posts:
-                if post.keywords:
+        updated_count = 0
+        async with async_session() as session:
+            for batch_id in pending:
+                try:
+                    batch = await openai_client.retrieve_batch(batch_id)
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось получить батч {batch_id}: {e}")
                     continue
 
-                text = (post.generated_text or "").strip()
-                if not text:
-                    logger.warning(f"🟡 Пропущен пост {post.id}, пустой текст")
+                if batch["status"] not in BATCH_TERMINAL_STATUSES:
+                    logger.info(f"⏳ Батч тегов {batch_id}: {batch['status']}")
                     continue
 
-                keywords = []
-                for attempt in range(MAX_RETRIES):
-                    try:
-                        await rate_limiter.wait()
-                        keywords = await openai_client.generate_keywords(text)
-                        if keywords:
-                            break
-                    except RateLimitError:
-                        logger.warning("⏳ Rate limit при генерации тегов, ждём 60 сек")
-                        await asyncio.sleep(60)
-                    except Exception as e:
-                        logger.warning(f"⚠️ Ошибка генерации тегов для {post.id}: {e}")
-
-                if not keywords:
-                    logger.error(f"❌ Не удалось сгенерировать теги для поста {post.id}")
+                if batch["status"] != "completed":
+                    logger.warning(f"⚠️ Батч тегов {batch_id} завершился со статусом {batch['status']}")
+
+                # У expired/cancelled батчей часть ответов тоже может быть готова
+                try:
+                    results = await openai_client.batch_results(batch)
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось получить результаты батча {batch_id}: {e}")
                     continue
 
-                for word in keywords:
-                    try:
-                        keyword_obj = (await session.execute(
-                            select(Keyword).where(Keyword.word == word)
-                        )).scalar_one_or_none()
+                # Посты могли удалить, пока батч обрабатывался
+                existing = set((await session.scalars(
+                    select(Post.id).where(Post.id.in_(list(results)))
+                )).all())
 
-                        if not keyword_obj:
-                            keyword_obj = Keyword(word=word)
-                            session.add(keyword_obj)
-                            await session.flush()
+                for post_id, response in results.items():
+                    if post_id not in existing:
+                        continue
 
-                        if keyword_obj not in post.keywords:
-                            post.keywords.append(keyword_obj)
+                    keywords = openai_client.parse_keywords(response or "")
+                    if not keywords:
+                        logger.error(f"❌ Не удалось сгенерировать теги для поста {post_id}")
+                        continue
 
-                    except IntegrityError:
-                        await session.rollback()
+                    await _save_keywords(session, post_id, keywords)
+                    updated_count += 1
+                    logger.info(f"🏷 Теги для поста {post_id}: {keywords}")
 
-                updated_count += 1
-                logger.info(f"🏷 Теги для поста {post.id}: {keywords}")
+                await session.commit()
+                await remove_pending_batch(batch_id)
 
-            await session.commit()
-            return updated_count
+        return updated_count
 
-    return asyncio.run(_main())
+    return run_async(_main())
@@ -1,16 +1,46 @@
 # app/tasks/telegram_tasks.py
 import asyncio
-from datetime import datetime
+import time
 from telethon import TelegramClient
+from telethon.errors import FloodWaitError
 from telethon.sessions import StringSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import selectinload, joinedload
 
-from app.celery_app import celery_app
+from app.celery_app import celery_app, run_async, on_loop_shutdown
 from app.database import async_session
 from app.models import Post, PostStatus
 from app.config import settings
 from app.logger import logger
+from app.utils.rate_limit import AIMDController
+from app.utils.telegram_client import SharedTelegramClient
+
+BATCH_SIZE = 20  # статусы отправленных постов обновляются пачками
+SEND_ATTEMPTS = 2  # попыток отправки поста (повтор после FloodWait)
+TELEGRAM_CONCURRENCY = 10  # стартовое число одновременных отправок
+
+# Пробелы, табы и дефисы разрывают хэштег в Telegram — заменяем на "_" за один проход
+_TAG_TRANS = str.maketrans(" \t-", "___")
+
+# Параллельность отправки в канал, снижается при FloodWait (живёт в процессе воркера)
+telegram_concurrency = AIMDController(c_min=1, c_max=TELEGRAM_CONCURRENCY, c0=TELEGRAM_CONCURRENCY)
+
+
+def _new_bot() -> TelegramClient:
+    """Клиент бота на StringSession: авторизация хранится в TELEGRAM_BOT_SESSION, а не в файле."""
+    if not settings.telegram_bot_session:
+        logger.info("🔑 TELEGRAM_BOT_SESSION не задан, бот авторизуется заново")
+    return TelegramClient(
+        StringSession(settings.telegram_bot_session),
+        settings.telegram_api_id,
+        settings.telegram_api_hash,
+    )
+
+
+# Клиент бота переиспользуется между запусками задачи (одно подключение на процесс)
+bot_client = SharedTelegramClient("Telegram client", _new_bot, bot_token=settings.telegram_bot_token)
+on_loop_shutdown(bot_client.disconnect)
+
 
 @celery_app.task(name="publish_posts_to_telegram")
 def publish_posts_to_telegram():
@@ -23,9 +53,7 @@ def publish_posts_to_telegram():
     - Ссылка на источник с иконкой
     """
     async def _main():
-        client = TelegramClient(StringSession(), settings.telegram_api_id, settings.telegram_api_hash)
-        await client.start(bot_token=settings.telegram_bot_token)
-        logger.info("✅ Telegram client started")
+        client = await bot_client.get()
 
         async with async_session() as session:
             result = await session.execute(
@@ -33,54 +61,70 @@ def publish_posts_to_telegram():
                 .where(Post.status == PostStatus.published)
                 .options(
                     selectinload(Post.keywords),  # загружаем теги
-                    selectinload(Post.news)       # загружаем связанный NewsItem
+                    joinedload(Post.news)         # связанный NewsItem тем же запросом (JOIN)
                 )
             )
-            posts = result.scalars().all()
-
-            count = 0
-            for post in posts:
-                try:
-                    message_text = post.generated_text or "Без текста"
-
-                    # Добавляем теги, если есть
-                    if post.keywords:
-                        tags_text = " ".join(f"#{kw.word.replace(' ', '_')}" for kw in post.keywords)
-                        message_text += f"\n\n`{tags_text}`"  # серый код-блок для тегов
-
-                    # Добавляем кликабельную ссылку на источник
-                    if post.news and post.news.url:
-                        message_text += f"\n\n🔗 [Источник]({post.news.url})"
-
-                    # Отправка сообщения с MarkdownV2
-                    await client.send_message(
-                        settings.telegram_channel_id,
-                        message_text,
-                        parse_mode="markdown"
-                    )
-
-                    # Обновляем статус поста после успешной публикации
-                    post.status = PostStatus.sent
-                    post.published_at = datetime.utcnow()
-                    await session.commit()
-
-                    logger.info(
-                        f"📣 Опубликован пост {post.id} "
-                        + (f"с тегами: {', '.join(kw.word for kw in post.keywords)}" if post.keywords else "без тегов")
-                        + (f" и источником: {post.news.url}" if post.news and post.news.url else "")
-                    )
-                    count += 1
-                    await asyncio.sleep(1)
-
-                except Exception as e:
-                    await session.rollback()
-                    logger.exception(f"❌ Ошибка публикации поста {post.id}: {e}")
-
-        await client.disconnect()
-        logger.info("✅ Telegram client disconnected")
+            posts = result.unique().scalars().all()
+
+            sent_ids = []
+
+            async def _send(post: Post):
+                message_text = post.generated_text or "Без текста"
+
+                # Добавляем теги, если есть
+                if post.keywords:
+                    tags_text = " ".join(f"#{kw.word.translate(_TAG_TRANS)}" for kw in post.keywords)
+                    message_text += f"\n\n`{tags_text}`"  # серый код-блок для тегов
+
+                # Добавляем кликабельную ссылку на источник
+                if post.news and post.news.url:
+                    message_text += f"\n\n🔗 [Источник]({post.news.url})"
+
+                async with telegram_concurrency.slot():
+                    for attempt in range(SEND_ATTEMPTS):
+                        started = time.monotonic()
+                        try:
+                            # Отправка сообщения с MarkdownV2
+                            await client.send_message(
+                                settings.telegram_channel_id,
+                                message_text,
+                                parse_mode="markdown"
+                            )
+                            break
+                        except FloodWaitError as e:
+                            # Telegram просит подождать — снижаем параллельность и ждём
+                            telegram_concurrency.on_error()
+                            if attempt == SEND_ATTEMPTS - 1:
+                                raise
+                            logger.warning(f"⏳ FloodWait {e.seconds} сек для поста {post.id}")
+                            await asyncio.sleep(e.seconds)
+                    telegram_concurrency.on_sample(time.monotonic() - started)
+
+                sent_ids.append(post.id)
+                logger.info(
+                    f"📣 Опубликован пост {post.id} "
+                    + (f"с тегами: {', '.join(kw.word for kw in post.keywords)}" if post.keywords else "без тегов")
+                    + (f" и источником: {post.news.url}" if post.news and post.news.url else "")
+                )
+
+            results = await asyncio.gather(*[_send(post) for post in posts], return_exceptions=True)
+            for post, result in zip(posts, results):
+                if isinstance(result, Exception):
+                    logger.error(f"❌ Ошибка публикации поста {post.id}: {result}")
+
+            # Статусы отправленных постов обновляем пачками, один commit на запуск
+            for i in range(0, len(sent_ids), BATCH_SIZE):
+                await session.execute(
+                    update(Post)
+                    .where(Post.id.in_(sent_ids[i:i + BATCH_SIZE]))
+                    .values(status=PostStatus.sent, published_at=func.now())
+                )
+            await session.commit()
+            count = len(sent_ids)
+
         return count
 
     # --- запуск асинхронной функции ---
-    count = asyncio.run(_main())
+    count = run_async(_main())
     logger.info(f"✅ Опубликовано постов в Telegram: {count}")
     return count
@@ -0,0 +1,81 @@
+# app/utils/atb.py
+import asyncio
+import time
+from app.logger import logger
+from app.utils.loop_bound import LoopBound
+
+
+class AdaptiveTokenBucket:
+    """
+    Адаптивный token bucket (ATB) для запросов к внешнему API.
+
+    Токены пополняются со скоростью rate (токенов в секунду).
+    После успешного запроса скорость растёт: rate = min(rate * alpha, cap).
+    При rate limit (HTTP 429) скорость падает: rate = max(rate / beta, sigma),
+    накопленные токены сбрасываются, а при наличии retry_after
+    выдача токенов приостанавливается на указанное время.
+
+    Пример:
+        r0=0.2, cap=2.0, alpha=1.1, beta=2.0
+        → старт с 1 запроса в 5 сек, разгон до 2 запросов в секунду
+    """
+
+    def __init__(
+        self,
+        r0: float = 0.2,
+        cap: float = 2.0,
+        alpha: float = 1.1,
+        beta: float = 2.0,
+        sigma: float = 0.05,
+        capacity: float = 1.0,
+    ):
+        self.rate = r0
+        self.cap = cap
+        self.alpha = alpha
+        self.beta = beta
+        self.sigma = sigma
+        self.capacity = capacity
+
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = LoopBound(asyncio.Lock)
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    async def acquire(self):
+        """Ждёт, пока в bucket появится токен, и забирает его."""
+        async with self._lock.get():
+            while True:
+                now = time.monotonic()
+
+                if now < self._paused_until:
+                    pause = self._paused_until - now
+                    logger.debug(f"⏳ Пауза после rate limit: {pause:.2f} сек")
+                    await asyncio.sleep(pause)
+                    continue
+
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                sleep_time = (1 - self._tokens) / self.rate
+                logger.debug(f"⏳ Ждём токен {sleep_time:.2f} сек (rate={self.rate:.3f}/сек)")
+                await asyncio.sleep(sleep_time)
+
+    def on_success(self):
+        """Успешный запрос — увеличиваем скорость."""
+        self.rate = min(self.rate * self.alpha, self.cap)
+
+    def on_fail(self, retry_after: float | None = None):
+        """Rate limit — уменьшаем скорость и сбрасываем токены."""
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = max(self.rate / self.beta, self.sigma)
+        self._tokens = 0.0
+        if retry_after:
+            self._paused_until = max(self._paused_until, now + retry_after)
+        logger.info(f"🛑 Rate limit, новая скорость {self.rate:.3f} запросов/сек")
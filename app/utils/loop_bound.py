@@ -0,0 +1,42 @@
+# app/utils/loop_bound.py
+import asyncio
+from typing import Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class LoopBound(Generic[T]):
+    """
+    Объект, привязанный к event loop (Lock, Condition, клиент с пулом соединений).
+
+    Создаётся фабрикой при первом обращении и заново при смене loop:
+    объекты asyncio и сетевые клиенты нельзя использовать из другого loop.
+
+    Пример:
+        self._lock = LoopBound(asyncio.Lock)
+        async with self._lock.get(): ...
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._value: T | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def get(self) -> T:
+        """Объект текущего loop (создаётся при необходимости)."""
+        loop = asyncio.get_running_loop()
+        if self._value is None or self._loop is not loop:
+            self._value = self._factory()
+            self._loop = loop
+        return self._value
+
+    def current(self) -> T | None:
+        """Объект текущего loop, если он уже создан (для закрытия), иначе None."""
+        if self._loop is asyncio.get_running_loop():
+            return self._value
+        return None
+
+    def reset(self):
+        """Забывает объект: следующий get() создаст новый."""
+        self._value = None
+        self._loop = None
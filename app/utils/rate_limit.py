@@ -1,55 +1,162 @@
 # app/utils/rate_limit.py
 import asyncio
+import random
 import time
+from collections import deque
+from contextlib import asynccontextmanager
+from statistics import mean
 from app.logger import logger
+from app.utils.loop_bound import LoopBound
 
 
-class CyclicRateLimiter:
+class SlidingWindowLimiter:
     """
-    Лимитер: burst запросов с интервалом, затем cooldown пауза.
+    Лимитер по скользящему окну: не больше rpm запросов и tpm токенов за window сек.
+
+    Дополнительно умеет вставать на паузу по подсказке сервера
+    (заголовки x-ratelimit-* и Retry-After).
 
     Пример:
-        burst=3, interval=20, cooldown=60
-        → 3 запроса каждые 20 сек
-        → затем пауза 60 сек
+        rpm=500, tpm=200_000
+        → 501-й запрос за минуту ждёт, пока из окна не выйдет самый старый
     """
 
-    def __init__(self, burst: int = 3, interval: float = 20.0, cooldown: float = 60.0):
-        self.burst = burst
-        self.interval = interval
-        self.cooldown = cooldown
+    def __init__(self, rpm: int = 500, tpm: int = 200_000, window: float = 60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+
+        self._calls: deque[list] = deque()  # [время запроса, токены]
+        self._tokens = 0
+        self._paused_until = 0.0
+        self._lock = LoopBound(asyncio.Lock)
+
+    def _evict(self, now: float):
+        """Убирает из окна запросы старше window сек."""
+        while self._calls and self._calls[0][0] <= now - self.window:
+            _, tokens = self._calls.popleft()
+            self._tokens -= tokens
+
+    async def wait(self, tokens: int = 0) -> list:
+        """
+        Ждёт, пока в окне освободится место под запрос на tokens токенов.
+        Возвращает запись окна для последующего record_usage.
+        """
+        async with self._lock.get():
+            while True:
+                now = time.monotonic()
+                self._evict(now)
+
+                sleep_for = self._paused_until - now
+                if self._calls and (
+                    len(self._calls) >= self.rpm
+                    or self._tokens + tokens > self.tpm
+                ):
+                    sleep_for = max(sleep_for, self._calls[0][0] + self.window - now)
+
+                if sleep_for <= 0:
+                    break
 
-        self._counter = 0
-        self._last_call = 0.0
-        self._lock = asyncio.Lock()
+                logger.debug(f"⏳ Ждём {sleep_for:.2f} сек перед следующим запросом")
+                await asyncio.sleep(sleep_for)
 
-    async def wait(self):
-        async with self._lock:
-            now = time.monotonic()
+            ticket = [now, tokens]
+            self._calls.append(ticket)
+            self._tokens += tokens
+            return ticket
 
-            # Интервал между запросами внутри burst
-            if self._counter > 0:
-                delta = now - self._last_call
-                if delta < self.interval:
-                    sleep_time = self.interval - delta
-                    logger.debug(f"⏳ Ждём {sleep_time:.2f} сек перед следующим запросом")
-                    await asyncio.sleep(sleep_time)
+    def record_usage(self, ticket: list, tokens: int):
+        """Заменяет оценку токенов запроса фактическим расходом из ответа."""
+        if ticket[0] <= time.monotonic() - self.window:
+            return  # запрос уже вышел из окна
+        self._tokens += tokens - ticket[1]
+        ticket[1] = tokens
 
-            # Если burst исчерпан — cooldown
-            if self._counter >= self.burst:
-                logger.info(f"🛑 Достигнут лимит {self.burst} запросов, пауза {self.cooldown} сек")
-                await asyncio.sleep(self.cooldown)
-                self._counter = 0
+    def pause_until(self, deadline: float):
+        """Запрещает новые запросы до deadline (time.monotonic())."""
+        if deadline > self._paused_until:
+            self._paused_until = deadline
+            logger.info(f"🛑 Пауза запросов на {deadline - time.monotonic():.1f} сек")
 
-            self._last_call = time.monotonic()
-            self._counter += 1
 
-            logger.debug(f"📤 Запрос {self._counter}/{self.burst}")
+class AIMDController:
+    """
+    AIMD-регулятор числа одновременных запросов.
+
+    Пока средняя задержка последних window запросов не превышает
+    target_latency, лимит растёт на alpha (additive increase).
+    При rate limit лимит умножается на beta (multiplicative decrease).
+
+    Пример:
+        c_min=1, c_max=16, alpha=0.5, beta=0.5
+        → +1 слот за 2 быстрых ответа, лимит вдвое меньше после 429
+    """
+
+    def __init__(
+        self,
+        c_min: int = 1,
+        c_max: int = 16,
+        c0: float | None = None,
+        alpha: float = 0.5,
+        beta: float = 0.5,
+        target_latency: float = 10.0,
+        window: int = 20,
+    ):
+        self.c_min = c_min
+        self.c_max = c_max
+        self.c = float(c0 if c0 is not None else c_min)
+        self.alpha = alpha
+        self.beta = beta
+        self.target_latency = target_latency
+
+        self._samples: deque[float] = deque(maxlen=window)
+        self._in_flight = 0
+        self._cond = LoopBound(self._new_condition)
+
+    def _new_condition(self) -> asyncio.Condition:
+        # Слоты, занятые на прежнем loop, там и остались
+        self._in_flight = 0
+        return asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Занимает слот, ожидая, пока запросов в работе станет меньше лимита."""
+        cond = self._cond.get()
+        async with cond:
+            await cond.wait_for(lambda: self._in_flight < int(self.c))
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            async with cond:
+                self._in_flight -= 1
+                cond.notify_all()
+
+    def on_sample(self, latency: float):
+        """Учитывает задержку успешного запроса."""
+        self._samples.append(latency)
+        if mean(self._samples) <= self.target_latency:
+            self.c = min(self.c + self.alpha, self.c_max)
+
+    def on_error(self):
+        """Rate limit — уменьшаем лимит параллельных запросов."""
+        self.c = max(self.c * self.beta, self.c_min)
+        logger.info(f"🛑 Лимит параллельных запросов снижен до {int(self.c)}")
+
+
+async def backoff(attempt: int, base: float = 1.0, cap: float = 30.0, jitter: float = 0.5):
+    """
+    Экспоненциальная пауза перед повтором: base * 2^attempt с случайной надбавкой до jitter.
+
+    Пример:
+        base=1, jitter=0.5 → 1–1.5 сек, 2–3 сек, 4–6 сек, ... но не больше cap
+    """
+    delay = min(cap, base * 2 ** attempt * (1 + random.random() * jitter))
+    logger.debug(f"⏳ Повтор через {delay:.2f} сек (попытка {attempt + 1})")
+    await asyncio.sleep(delay)
 
 
 async def random_delay(min_seconds: float = 1.5, max_seconds: float = 4.0):
-    import random, asyncio
-    from app.logger import logger
     delay = random.uniform(min_seconds, max_seconds)
     logger.debug(f"⏳ Задержка перед следующим запросом: {delay:.2f} сек")
-    await asyncio.sleep(delay)
\ No newline at end of file
+    await asyncio.sleep(delay)
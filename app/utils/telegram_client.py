@@ -0,0 +1,40 @@
+# app/utils/telegram_client.py
+import asyncio
+from typing import Callable
+
+from telethon import TelegramClient
+
+from app.logger import logger
+from app.utils.loop_bound import LoopBound
+
+
+class SharedTelegramClient:
+    """
+    Клиент Telethon, переиспользуемый между вызовами (одно подключение на процесс).
+
+    Подключается при первом get(), при смене event loop создаётся заново.
+    start_kwargs передаются в TelegramClient.start() (например, bot_token).
+    """
+
+    def __init__(self, name: str, factory: Callable[[], TelegramClient], **start_kwargs):
+        self.name = name
+        self._client = LoopBound(factory)
+        self._lock = LoopBound(asyncio.Lock)
+        self._start_kwargs = start_kwargs
+
+    async def get(self) -> TelegramClient:
+        """Возвращает подключённый клиент."""
+        async with self._lock.get():
+            client = self._client.get()
+            if not client.is_connected():
+                await client.start(**self._start_kwargs)
+                logger.info(f"✅ {self.name} connected")
+        return client
+
+    async def disconnect(self):
+        """Отключает клиент (после задачи или при остановке воркера)."""
+        client = self._client.current()
+        if client is not None and client.is_connected():
+            await client.disconnect()
+            logger.info(f"✅ {self.name} disconnected")
+        self._client.reset()
@@ -0,0 +1,11 @@
+# app/utils/text.py
+
+
+def shorten(text: str, limit: int, suffix: str = "...") -> str:
+    """
+    Обрезает текст до limit символов и добавляет suffix,
+    если текст длиннее лимита. Иначе возвращает исходную строку.
+    """
+    if len(text) <= limit:
+        return text
+    return text[:limit] + suffix